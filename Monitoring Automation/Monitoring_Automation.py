@@ -1,13 +1,27 @@
+import asyncio
+import collections
+import concurrent.futures
 import datetime
+import itertools
+import queue
 import threading
 import time
+import timeit
+import ahocorasick
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import schedule
-from prometheus_client import start_http_server
+from prometheus_client import make_wsgi_app
 from prometheus_client import Gauge
 from flask import *
-import click
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from waitress import serve
+import logging
+from logging.handlers import RotatingFileHandler
 import json
+import orjson
 import pymssql
 
 #This script was developed to enable "push" monitoring of Crestron Fusion, Dante Domain Manager, and Biamp Sagevue.
@@ -19,12 +33,40 @@ import pymssql
 # Flask server for adjusting script behavior.
 AlertREST = Flask(__name__)
 
+# Number of worker threads serving the REST endpoints and the Prometheus metrics.
+HTTP_SERVER_THREADS = 4
+
 # Script startup alert behavior (should alerts be automatically enabled upon script launch)?
 SEND_ALERTS = False
 
-# Polling frequency (in seconds).
+# Polling frequency (in seconds) at script launch.
 PROG_REFRESH_FREQUENCY = 15
 
+# Set when the script is shutting down, to stop the polling loop.
+SHUTDOWN = threading.Event()
+PROG_THREAD = None
+
+# Polling frequency bounds (in seconds). Polling speeds up to MIN_POLL whenever alerts change, and backs off towards MAX_POLL while quiet.
+MIN_POLL = 5
+MAX_POLL = 60
+POLL_BACKOFF = 1.5
+
+# Script log, written to a rotating file in the working directory (alongside MonitoringData.json). The file is only created once something is logged.
+log = logging.getLogger('monitoring')
+log.setLevel(logging.INFO)
+LOG_HANDLER = RotatingFileHandler('Monitoring.log', maxBytes=5 * 1024 * 1024, backupCount=3, delay=True)
+LOG_HANDLER.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+log.addHandler(LOG_HANDLER)
+
+# Minimum time (in seconds) between logging the same error from the same source.
+ERROR_LOG_INTERVAL = 60
+ERROR_LAST_LOGGED = {}
+
+# Number of consecutive failures before a source is polled less often. The wait doubles with each further failure, starting at MIN_POLL and capped at MAX_POLL.
+ERROR_BACKOFF_THRESHOLD = 3
+SOURCE_FAILURES = {}
+SOURCE_RETRY_AT = {}
+
 # Keywords to ignore when sending out alerts.
 BLACKLISTED_KEYWORDS = ["ExampleKeyword1", "Test Devices"]
 
@@ -38,6 +80,15 @@ with open('MonitoringData.json', 'r') as file:
     # Load the json data to be used in the script.
     script_variables = json.load(file)
 
+# Connect/read timeouts (in seconds) applied to every outbound HTTP request.
+HTTP_TIMEOUT = (3, 5)
+
+# Shared HTTP session, so repeated calls to the same host reuse the existing TCP/TLS connection.
+HTTP = requests.Session()
+HTTP.headers.update({"Content-Type": "application/json"})
+HTTP_ADAPTER = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=Retry(total=3, backoff_factor=0.2))
+HTTP.mount('https://', HTTP_ADAPTER)
+HTTP.mount('http://', HTTP_ADAPTER)
 
 #endregion
 
@@ -49,19 +100,54 @@ DDM_URL = script_variables['DDM_URL']
 # DDM API key, generated from the web interface.
 DDM_API_KEY = script_variables['DDM_API_Key']
 
+# Maximum number of DDM domains queried at the same time.
+DDM_MAX_CONNECTIONS = 16
+
+# Event loop for the concurrent DDM domain queries. It runs on its own thread, so the aiohttp session (and its keep-alive connections) persists across polling cycles.
+DDM_LOOP = asyncio.new_event_loop()
+DDM_SESSION = None
+
+# Maximum time (in seconds) to wait for all of the DDM domain queries in a polling cycle.
+DDM_QUERY_TIMEOUT = 30
+
 # Lists for storing DDM related data.
 DDM_DOMAINS = []
+
+# Set when a domain query returns no domain (for example, the domain was removed), so the domain list is fetched again on the next cycle.
+DDM_DOMAINS_STALE = False
 DDM_DEVICES = []
-DDM_ERROR_LIST = []
-DDM_OFFLINE_LIST = []
-DDM_TEMP_LIST = []
-DDM_TEMP_OFFLINE_LIST = []
+
+# Sets of active DDM alerts, keyed by the alert string.
+DDM_ERROR_LIST = set()
+DDM_OFFLINE_LIST = set()
+DDM_TEMP_LIST = set()
+DDM_TEMP_OFFLINE_LIST = set()
 
 # List for storing temporarily muted keywords.
 ALERTS_TEMP_IGNORE = []
 
+# Aho-Corasick automaton matching any muted keyword, rebuilt whenever the muted keyword list changes. None while nothing is muted.
+ALERTS_TEMP_IGNORE_AUTOMATON = None
+ALERTS_TEMP_IGNORE_LOCK = threading.Lock()
+
 # Used for batching alerts, to not spam the webhook whenever a large amount of alerts are sent out at once.
-ALERTS_NOTIF_LIST = []
+ALERTS_NOTIF_QUEUE = queue.Queue()
+
+# Guards the DDM, SageVue and Fusion alert state, which is read by the REST endpoints while the polling thread updates it.
+STATE_LOCK = threading.RLock()
+
+# Used for batching help requests in timed frames, so several requests are sent out as a single webhook.
+HELP_REQUEST_QUEUE = collections.deque()
+HELP_REQUEST_LAST_FLUSH = timeit.default_timer()
+
+# Minimum time (in seconds) between help request webhooks.
+WH_FRAME_INTERVAL = 5
+
+# Number of queued help requests that forces a webhook to be sent, regardless of the frame interval.
+WH_BATCH_MAX = 20
+
+# Maximum number of body blocks allowed in a single Zoom webhook message.
+ZOOM_MAX_BODY_BLOCKS = 50
 
 # Prometheus DDM gauges, used for the graphical display of active issues.
 DDM_Total_Errors = Gauge('ddm_total_errors', 'Total errors across DDM.')
@@ -89,15 +175,17 @@ getDevices = """query Devices($name: String) {
     }
 }"""
 
+# Pre-serialized request body for the domains query, which never changes.
+GET_DOMAINS_BODY = orjson.dumps({'query': getDomains, 'variables': {}})
+
 #endregion
 
 #region SageVue Info
 
 SageVue_SessionID = 'Placeholder'
-SageVue_Error_List = []
+SageVue_Error_List = set()
 SageVue_Offline_List = []
 
-SageVue_Auth_Query_Endpoint = script_variables['SageVue_Auth_Query_Endpoint']
 SageVue_Login_Endpoint = script_variables['SageVue_Login_Endpoint']
 SageVue_Systems_Endpoint = script_variables['SageVue_Systems_Endpoint']
 SageVue_Devices_Endpoint = script_variables['SageVue_Devices_Endpoint']
@@ -116,9 +204,22 @@ FusionSQLServer = script_variables['Fusion_SQL_Server']
 FusionSQLUsername = script_variables['Fusion_SQL_Username']
 FusionSQLPassword = script_variables['Fusion_SQL_Password']
 
-Fusion_Error_List = []
-Fusion_Offline_List = []
-Fusion_Help_Request_List = []
+# Fusion database connection, reused across polling cycles. Reset to None whenever the connection fails.
+Fusion_Connection = None
+
+# LIKE patterns for the blacklisted keywords, with the SQL Server wildcard characters escaped.
+Fusion_Blacklist_Params = tuple('%' + k.replace('[', '[[]').replace('%', '[%]').replace('_', '[_]') + '%' for k in BLACKLISTED_KEYWORDS)
+
+# SQL predicate excluding rooms (aliased as r) whose name contains a blacklisted keyword. Takes Fusion_Blacklist_Params as its parameters.
+Fusion_Blacklist_Predicate = ' AND '.join(['r.RoomName NOT LIKE %s'] * len(BLACKLISTED_KEYWORDS)) or '1 = 1'
+
+# Number of rows pulled from the Fusion database at a time.
+Fusion_Fetch_Size = 500
+
+# Active Fusion alerts. Error and help request entries are keyed by (RoomID, message), with the room name as the value.
+Fusion_Error_List = {}
+Fusion_Offline_List = set()
+Fusion_Help_Request_List = {}
 
 #endregion
 
@@ -155,32 +256,119 @@ usingHelpRequestToken = helpRequestToken
 
 #endregion
 
+#region Zoom Message Templates
+
+#Constant parts of the Zoom webhook messages. Only the text of each message is built per call.
+NOTIFICATION_HEAD = {"text": "Program Notification", "style": {"color": "#9d0bf4"}}
+NOTIFICATION_STYLE = {"color": "#305acf"}
+
+ALERT_HEAD = {"text": "Device Alert", "style": {"color": "#C107EB"}}
+ALERT_STYLE = {"color": "#C107EB", "sidebar_color": "#C107EB"}
+
+HELP_REQUEST_HEAD = {"text": "Help Request Alert", "style": {"color": "#00FF00"}}
+HELP_REQUEST_STYLE = {"color": "#449FD4", "sidebar_color": "#449FD4"}
+
+REPORT_HEAD_STYLE = {"color": "#00DD00"}
+REPORT_TITLE_STYLE = {"color": "#0000FF"}
+REPORT_OK_STYLE = {"color": "#00FF00"}
+REPORT_ERROR_STYLE = {"color": "#C107EB"}
+
+#Report section contents that indicate there is nothing wrong.
+REPORT_OK_MESSAGES = ("No errors to report.", "No mics with low batteries.")
+
+#endregion
+
 #region Script Methods
 def prog_thread():
-    #Fetch the domains at script start.
-    get_dante_domains()
-
-    #Infinite loop, iterate over each step after sleeping for the specified amount of time.
-    while True:
-        try:
-            fusion_thread()
-            sage_vue_thread()
-            ddm_thread()
-        except Exception as e:
-            click.echo(e)
+    #Deadline for the next iteration, using a monotonic clock so the polling cadence does not drift.
+    next_tick = time.monotonic()
+    poll_interval = PROG_REFRESH_FREQUENCY
+
+    #Loop until shutdown, iterate over each step after sleeping for the specified amount of time.
+    while not SHUTDOWN.is_set():
+        previous_state = get_alert_state()
+
+        #Poll each source separately, so one failing source does not stop the others from being polled.
+        run_source("Fusion", fusion_thread)
+        run_source("SageVue", sage_vue_thread)
+
+        #Fetch the DDM domains at script start, and whenever the domain list is out of date, retrying each cycle until the fetch succeeds.
+        #DDM is not polled until the first fetch succeeds, so a failed fetch does not clear the DDM alert state.
+        if len(DDM_DOMAINS) == 0 or DDM_DOMAINS_STALE:
+            run_source("DDM Domains", get_dante_domains)
+        if len(DDM_DOMAINS) > 0:
+            run_source("DDM", ddm_thread)
+
+        #Speed up polling while alerts are changing, and back off while everything is quiet.
+        #New alerts and help requests always change the alert state. Alerts still queued from a failed webhook do not, so a webhook outage does not keep polling at MIN_POLL.
+        if get_alert_state() != previous_state:
+            poll_interval = MIN_POLL
+        else:
+            poll_interval = min(MAX_POLL, poll_interval * POLL_BACKOFF)
         
         #If any new alerts were generated, send them out.
-        send_alert_notif()
+        #These are run the same way as the sources, so a failing webhook or scheduled event does not stop the polling thread.
+        run_source("Zoom Alerts", send_alert_notif)
+
+        #Send out any help requests queued during this frame.
+        run_source("Zoom Help Requests", flush_help_requests)
         
         #Run any pending scheduled events.
-        schedule.run_pending()
-
-        #Pause the script execution.
-        time.sleep(PROG_REFRESH_FREQUENCY)
+        run_source("Schedule", schedule.run_pending)
+
+        #Pause the script execution until the next deadline.
+        #If this iteration overran the deadline, start the next one immediately and reset the schedule, rather than trying to catch up.
+        next_tick += poll_interval
+        sleep_for = next_tick - time.monotonic()
+        if sleep_for > 0:
+            SHUTDOWN.wait(sleep_for)
+        else:
+            next_tick = time.monotonic()
+
+#Logs an error from a source, unless the same error from the same source was already logged within ERROR_LOG_INTERVAL.
+def log_error(source, error):
+    key = source + " - " + repr(error)
+    now = time.monotonic()
+    if now - ERROR_LAST_LOGGED.get(key, -ERROR_LOG_INTERVAL) >= ERROR_LOG_INTERVAL:
+        #Forget errors that have not been seen within the interval, so the dictionary does not grow without bound.
+        for old_key in [k for k, t in ERROR_LAST_LOGGED.items() if now - t >= ERROR_LOG_INTERVAL]:
+            del ERROR_LAST_LOGGED[old_key]
+        ERROR_LAST_LOGGED[key] = now
+        log.error("%s failed: %r", source, error, exc_info=error)
+
+#Runs a single polling source, or any other step of the polling loop.
+#Failures are logged with log_error, and after ERROR_BACKOFF_THRESHOLD consecutive failures the source is skipped for an increasing amount of time.
+def run_source(source, function):
+    now = time.monotonic()
+    if now < SOURCE_RETRY_AT.get(source, 0):
+        return
+    try:
+        function()
+        SOURCE_FAILURES[source] = 0
+    except Exception as e:
+        failures = SOURCE_FAILURES.get(source, 0) + 1
+        SOURCE_FAILURES[source] = failures
+        log_error(source, e)
+        if failures >= ERROR_BACKOFF_THRESHOLD:
+            SOURCE_RETRY_AT[source] = now + min(MAX_POLL, MIN_POLL * 2 ** (failures - ERROR_BACKOFF_THRESHOLD))
 
 #Starts the main script thread.
 def start_services():
-    threading.Thread(target=prog_thread).start()
+    global PROG_THREAD
+    threading.Thread(target=DDM_LOOP.run_forever, daemon=True).start()
+    PROG_THREAD = threading.Thread(target=prog_thread)
+    PROG_THREAD.start()
+
+#Stops the main script thread, then closes the DDM session and stops its event loop.
+def stop_services():
+    SHUTDOWN.set()
+    if PROG_THREAD is not None:
+        PROG_THREAD.join(MAX_POLL)
+    if DDM_LOOP.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(close_ddm_session(), DDM_LOOP).result(DDM_QUERY_TIMEOUT)
+        finally:
+            DDM_LOOP.call_soon_threadsafe(DDM_LOOP.stop)
 
 #Enables alerts to be sent to the proper endpoints.
 def enable_alerts(send_notif):
@@ -208,19 +396,50 @@ def mute_thread(args):
     else:
         try:
             send_notification("Muting alerts containing " + args[0] + " for " + args[1] + " minutes.")
-            ALERTS_TEMP_IGNORE.append(args[0])
+            with ALERTS_TEMP_IGNORE_LOCK:
+                ALERTS_TEMP_IGNORE.append(args[0])
+                rebuild_mute_automaton()
             time.sleep(int(args[1])*60)
-            ALERTS_TEMP_IGNORE.remove(args[0])
+            with ALERTS_TEMP_IGNORE_LOCK:
+                ALERTS_TEMP_IGNORE.remove(args[0])
+                rebuild_mute_automaton()
             send_notification("Alerts containing " + args[0] + " are no longer muted!")
         except:
             send_notification("Unknown error muting alerts containing " + args[0] + ".")
             return "Error"
     return "Success"
 
+#Builds an Aho-Corasick automaton matching any of the given keywords, or None if there are no non-empty keywords.
+#Empty keywords are skipped, since an automaton without any words cannot be searched.
+def build_keyword_automaton(keywords):
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        if keyword:
+            automaton.add_word(keyword, keyword)
+    if len(automaton) == 0:
+        return None
+    automaton.make_automaton()
+    return automaton
+
+#Checks if the text contains any of the keywords in the automaton, in a single pass over the text.
+def contains_keyword(automaton, text):
+    return automaton is not None and any(True for _ in automaton.iter(text))
+
+#Rebuilds the muted keyword automaton from the muted keyword list. Must be called while holding ALERTS_TEMP_IGNORE_LOCK.
+def rebuild_mute_automaton():
+    global ALERTS_TEMP_IGNORE_AUTOMATON
+    ALERTS_TEMP_IGNORE_AUTOMATON = build_keyword_automaton(ALERTS_TEMP_IGNORE)
+
+#Returns a snapshot of all currently active alerts, used to detect whether anything changed during a polling cycle.
+def get_alert_state():
+    with STATE_LOCK:
+        return (frozenset(DDM_ERROR_LIST), frozenset(DDM_OFFLINE_LIST), frozenset(SageVue_Error_List),
+                frozenset(Fusion_Error_List), frozenset(Fusion_Offline_List), frozenset(Fusion_Help_Request_List))
+
 #Adds an alert to the list of upcoming alerts to send out.
 def add_to_alert_notif_push(category, device, message):
-    if not any(ext in device for ext in ALERTS_TEMP_IGNORE) and not any(ext in message for ext in ALERTS_TEMP_IGNORE):
-        ALERTS_NOTIF_LIST.append(category + " - " + device + " - " + message)
+    if not contains_keyword(ALERTS_TEMP_IGNORE_AUTOMATON, device) and not contains_keyword(ALERTS_TEMP_IGNORE_AUTOMATON, message):
+        ALERTS_NOTIF_QUEUE.put(category + " - " + device + " - " + message)
 #endregion
 
 
@@ -250,6 +469,8 @@ def manual_mute():
     try:
         keyword = request.args.get('keyword')
         length = request.args.get('length')
+        if not keyword:
+            return "Cannot mute alerts - keyword parameter is missing or empty."
         data = [keyword, length]
         threading.Thread(target=mute_thread, args=(data,)).start()
         return "Success"
@@ -262,63 +483,94 @@ def manual_mute():
 
 #
 def ddm_thread():
+    global DDM_DOMAINS_STALE
     
     #Clear the temporary lists holding previous alerts.
     DDM_TEMP_LIST.clear()
     DDM_TEMP_OFFLINE_LIST.clear()
+
+    #Fetch all the devices in each domain, querying the domains concurrently.
+    #Results are handled one domain at a time, in the same order as the domain list.
+    #If the queries do not finish within DDM_QUERY_TIMEOUT (or DDM_LOOP is not running), cancel them and keep the previous state.
+    domains = list(DDM_DOMAINS)
+    future = asyncio.run_coroutine_threadsafe(fetch_all_domains(domains), DDM_LOOP)
     try:
-        #Iterate through each domain and fetch all the devices in each domain.
-        for domain in DDM_DOMAINS:
-            variables = {'name': domain}
-            result = run_ddm_query(getDevices, 200, variables)
-            
-            #Iterate through each device and check each for specific types of errors.
-            for device in result["data"]["domain"]["devices"]:
-                
-                #Connectivity error (Device offline).
-               if device["status"]["connectivity"] == "ERROR":
-                connectivity_string = domain + " - " + device["name"] + " is offline."
-                DDM_TEMP_OFFLINE_LIST.append(connectivity_string)
-                if connectivity_string not in DDM_OFFLINE_LIST:
-                    DDM_OFFLINE_LIST.append(connectivity_string)
-                    add_to_alert_notif_push("DDM", domain, device["name"] + " is offline.")
-
-                #Subsciption error (flow is not connected)
-                if device["status"]["subscriptions"] == "ERROR":
-                    sub_string = domain + " - " + device["name"] + " has a subscription error."
-                    DDM_TEMP_LIST.append(sub_string)
-                    if sub_string not in DDM_ERROR_LIST:
-                        DDM_ERROR_LIST.append(sub_string)
-                        add_to_alert_notif_push("DDM", domain, device["name"] + " has a subscription error.")
-                
-                #Latency error.
-                if device["status"]["latency"] == "ERROR":
-                    latency_string = domain + " - " + device["name"] + " has a latency error."
-                    DDM_TEMP_LIST.append(latency_string)
-                    if latency_string not in DDM_ERROR_LIST:
-                        DDM_ERROR_LIST.append(latency_string)
-                        add_to_alert_notif_push("DDM", domain, device["name"] + " has a latency error.")
-
-                #Clocking error.
-                if device["status"]["clocking"] == "ERROR":
-                    clock_string = domain + " - " + device["name"] + " has a clocking error."
-                    DDM_TEMP_LIST.append(clock_string)
-                    if clock_string not in DDM_ERROR_LIST:
-                        DDM_ERROR_LIST.append(clock_string)
-                        add_to_alert_notif_push("DDM", domain, device["name"] + " has a clocking error.")
-                            
-    except Exception as e:
-        click.echo(repr(e))
+        results = future.result(DDM_QUERY_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+    #Split the results into the devices of each domain, and the domains that could not be queried.
+    #A domain query that returns no domain means the domain list is out of date.
+    devices_by_domain = {}
+    errors_by_domain = {}
+    for domain, result in zip(domains, results):
+        if isinstance(result, BaseException):
+            errors_by_domain[domain] = result
+        elif result.get("errors") or (result.get("data") or {}).get("domain") is None:
+            errors_by_domain[domain] = Exception(f"No data returned for domain {domain}: {result.get('errors')}")
+            DDM_DOMAINS_STALE = True
+        else:
+            devices_by_domain[domain] = result["data"]["domain"]["devices"]
+
+    #If no domain could be queried, fail the whole poll so the previous state is kept and the source backs off.
+    if len(devices_by_domain) == 0:
+        raise next(iter(errors_by_domain.values()))
+    for domain, error in errors_by_domain.items():
+        log_error("DDM - " + domain, error)
+
+    #Alerts for new errors are only queued once the new state has been swapped in, so a poll that fails partway through does not queue them again next cycle.
+    new_alerts = []
+    for domain, devices in devices_by_domain.items():
+
+        #Iterate through each device and check each for specific types of errors.
+        for device in devices:
+            status = device["status"]
+            name = device["name"]
+            prefix = f"{domain} - {name}"
+
+            #Connectivity error (Device offline).
+            if status["connectivity"] == "ERROR":
+                connectivity_string = f"{prefix} is offline."
+                if connectivity_string not in DDM_OFFLINE_LIST and connectivity_string not in DDM_TEMP_OFFLINE_LIST:
+                    new_alerts.append(("DDM", domain, f"{name} is offline."))
+                DDM_TEMP_OFFLINE_LIST.add(connectivity_string)
+
+            #Subsciption error (flow is not connected)
+            if status["subscriptions"] == "ERROR":
+                sub_string = f"{prefix} has a subscription error."
+                if sub_string not in DDM_ERROR_LIST and sub_string not in DDM_TEMP_LIST:
+                    new_alerts.append(("DDM", domain, f"{name} has a subscription error."))
+                DDM_TEMP_LIST.add(sub_string)
         
-    #Iterate through the list of errors, and remove any that are no longer active.
-    for error in DDM_ERROR_LIST:
-        if error not in DDM_TEMP_LIST:
-            DDM_ERROR_LIST.remove(error)
-
-    #Iterate through the list of offline devices, and remove any that are back online.
-    for device in DDM_OFFLINE_LIST:
-        if device not in DDM_TEMP_OFFLINE_LIST:
-            DDM_OFFLINE_LIST.remove(device)
+            #Latency error.
+            if status["latency"] == "ERROR":
+                latency_string = f"{prefix} has a latency error."
+                if latency_string not in DDM_ERROR_LIST and latency_string not in DDM_TEMP_LIST:
+                    new_alerts.append(("DDM", domain, f"{name} has a latency error."))
+                DDM_TEMP_LIST.add(latency_string)
+
+            #Clocking error.
+            if status["clocking"] == "ERROR":
+                clock_string = f"{prefix} has a clocking error."
+                if clock_string not in DDM_ERROR_LIST and clock_string not in DDM_TEMP_LIST:
+                    new_alerts.append(("DDM", domain, f"{name} has a clocking error."))
+                DDM_TEMP_LIST.add(clock_string)
+                    
+    #Swap in the errors and offline devices found this cycle, dropping any that are no longer active.
+    #If the DDM query fails, the previous state is kept until the next successful poll. Domains that could not be queried also keep their previous state.
+    with STATE_LOCK:
+        for domain in errors_by_domain:
+            prefix = domain + " - "
+            DDM_TEMP_LIST.update(e for e in DDM_ERROR_LIST if e.startswith(prefix))
+            DDM_TEMP_OFFLINE_LIST.update(e for e in DDM_OFFLINE_LIST if e.startswith(prefix))
+        DDM_ERROR_LIST.clear()
+        DDM_ERROR_LIST.update(DDM_TEMP_LIST)
+        DDM_OFFLINE_LIST.clear()
+        DDM_OFFLINE_LIST.update(DDM_TEMP_OFFLINE_LIST)
+
+    for alert in new_alerts:
+        add_to_alert_notif_push(*alert)
 
     #Update the prometheus metrics 
     DDM_Missing_Devices.set(len(DDM_OFFLINE_LIST))
@@ -326,336 +578,390 @@ def ddm_thread():
 
 #Function to format the DDM error and offline lists into a single string return value.
 def get_ddm_status_message():
-    temp_string = ""
-    for x in range(len(DDM_ERROR_LIST)):
-        temp_string = temp_string + DDM_ERROR_LIST[x]
-        if x < len(DDM_ERROR_LIST) - 1:
-            temp_string = temp_string + "\r"
-    for x in range(len(DDM_OFFLINE_LIST)):
-        temp_string = temp_string + DDM_OFFLINE_LIST[x]
-        if x < len(DDM_OFFLINE_LIST) - 1:
-            temp_string = temp_string + "\r"
-    if len(DDM_ERROR_LIST) == 0 and len(DDM_OFFLINE_LIST) == 0:
-        return "No errors to report."
-    else:
-        return temp_string
+    with STATE_LOCK:
+        return "\r".join(sorted(DDM_ERROR_LIST) + sorted(DDM_OFFLINE_LIST)) or "No errors to report."
 
-#Function to get the current DDM domains.
+#Function to get the current DDM domains. The domain list is only replaced once the query has succeeded.
 def get_dante_domains():
-    DDM_DOMAINS.clear()
+    global DDM_DOMAINS_STALE
     temp_domains = run_ddm_query(getDomains, 200, {})
-    for key in temp_domains["data"]["domains"]:
-        DDM_DOMAINS.append(key["name"])
+    DDM_DOMAINS[:] = [key["name"] for key in temp_domains["data"]["domains"]]
+    DDM_DOMAINS_STALE = False
+
+#Marks the DDM domain list as out of date, so the polling loop fetches it again (retrying until the fetch succeeds).
+def refresh_dante_domains():
+    global DDM_DOMAINS_STALE
+    DDM_DOMAINS_STALE = True
 
 #Function to run a query on the DDM API.
 def run_ddm_query(query, status_code, variables):
-    new_request = requests.post(DDM_URL, json={'query': query, 'variables': variables}, headers={"Authorization": DDM_API_KEY})
+    #Use the pre-serialized body for the static domains query, otherwise serialize the query and its variables.
+    if query is getDomains and not variables:
+        body = GET_DOMAINS_BODY
+    else:
+        body = orjson.dumps({'query': query, 'variables': variables})
+    new_request = HTTP.post(DDM_URL, data=body, headers={"Authorization": DDM_API_KEY}, timeout=HTTP_TIMEOUT)
     if new_request.status_code == status_code:
-        return new_request.json()
+        return orjson.loads(new_request.content)
     else:
         raise Exception(f"Unexpected status code returned: {new_request.status_code}")
+
+#Returns the shared aiohttp session for the DDM API, creating it if necessary. Must be run on DDM_LOOP.
+async def get_ddm_session():
+    global DDM_SESSION
+    if DDM_SESSION is None or DDM_SESSION.closed:
+        DDM_SESSION = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=DDM_MAX_CONNECTIONS, keepalive_timeout=60),
+                                            headers={"Authorization": DDM_API_KEY, "Content-Type": "application/json"},
+                                            timeout=aiohttp.ClientTimeout(sock_connect=HTTP_TIMEOUT[0], sock_read=HTTP_TIMEOUT[1]))
+    return DDM_SESSION
+
+#Closes the shared aiohttp session for the DDM API. Must be run on DDM_LOOP.
+async def close_ddm_session():
+    global DDM_SESSION
+    if DDM_SESSION is not None:
+        await DDM_SESSION.close()
+        DDM_SESSION = None
+
+#Asynchronous version of run_ddm_query, using the shared aiohttp session.
+async def run_ddm_query_async(session, query, status_code, variables):
+    async with session.post(DDM_URL, data=orjson.dumps({'query': query, 'variables': variables})) as new_request:
+        if new_request.status == status_code:
+            return orjson.loads(await new_request.read())
+        else:
+            raise Exception(f"Unexpected status code returned: {new_request.status}")
+
+#Fetches the devices in each of the given domains concurrently. Results are returned in the same order as the domains.
+#A domain query that fails returns its exception in place of the result, so the other domains are still handled.
+async def fetch_all_domains(domains):
+    session = await get_ddm_session()
+    return await asyncio.gather(*[run_ddm_query_async(session, getDevices, 200, {'name': domain}) for domain in domains], return_exceptions=True)
 # endregion
 
 #region SageVue Functions
-def sage_vue_thread():
+#Runs a GET request against the SageVue API. If the session ID is rejected, log in again and retry once.
+def sage_get(url):
     global SageVue_SessionID
-    try:
-        # Check API key. If invalid, generate new key.
-        api_check = requests.get(SageVue_Auth_Query_Endpoint, headers={'SessionID': SageVue_SessionID}, timeout=5)
+    response = HTTP.get(url, headers={'SessionID': SageVue_SessionID}, timeout=HTTP_TIMEOUT)
 
-        if api_check.status_code == 400 or api_check.status_code == 401:
-            #Invalid status return. Use the login endpoint to generate a new session ID.
-            session_id = requests.post(SageVue_Login_Endpoint, json={"credentials": {'username': SageVue_Username, 'password': SageVue_Password}})
-            SageVue_SessionID = session_id.json()['LoginId']
+    if response.status_code == 400 or response.status_code == 401:
+        #Invalid status return. Use the login endpoint to generate a new session ID.
+        session_id = HTTP.post(SageVue_Login_Endpoint, json={"credentials": {'username': SageVue_Username, 'password': SageVue_Password}}, timeout=HTTP_TIMEOUT)
+        SageVue_SessionID = session_id.json()['LoginId']
+        response = HTTP.get(url, headers={'SessionID': SageVue_SessionID}, timeout=HTTP_TIMEOUT)
 
-        # Request the systems and devices
-        api_systems = requests.get(SageVue_Systems_Endpoint, headers={'SessionID': SageVue_SessionID}, timeout=5)
-        api_devices = requests.get(SageVue_Devices_Endpoint, headers={'SessionID': SageVue_SessionID}, timeout=5)
+    return response
 
-        # Temporary variable for storing systems
-        systems = api_systems.json()['Systems']
+def sage_vue_thread():
+    # Request the systems and devices. The session ID is only refreshed when SageVue rejects it.
+    api_systems = sage_get(SageVue_Systems_Endpoint)
+    api_devices = sage_get(SageVue_Devices_Endpoint)
 
-        temp_error_list = []
-        
-        # Iterate through the systems.
-        # For each system status that is not "Green", list out each fault the system currently has, and append to error list.
-        for system in systems:
-            if system['Status'] != "Green":
-                for fault in system["Faults"]:
-                    error_id = system["Description"] + " - " + fault["Message"]
-                    temp_error_list.append(error_id)
-
-                    # Send alerts for new errors.
-                    # Block out Dante Mute and NTP errors. 
-                    # In a sufficiently large network, these types of alerts are guaranteed and not a priority.
-                    if error_id not in SageVue_Error_List and "DAN1" not in fault["Message"] and "NTP" not in fault["Message"]:
-                        SageVue_Error_List.append(error_id)
-                        add_to_alert_notif_push("SageVue", system["Description"], fault["Message"])
-
-        # If the error no longer exists, remove from the list. This prevents duplicate errors from sending out alerts.
-        for error in SageVue_Error_List:
-            if error not in temp_error_list:
-                SageVue_Error_List.remove(error)
-
-        # Set the prometheus metrics with the new information.
-        Sagevue_Total_Errors.set(len(SageVue_Error_List))
-        Sagevue_Missing_Devices.set(len(api_devices.json()['Errors']))
+    # Temporary variable for storing systems
+    systems = api_systems.json()['Systems']
 
-    except Exception as e:
-        click.echo(repr(e))
+    temp_error_list = set()
+    new_alerts = []
+    
+    # Iterate through the systems.
+    # For each system status that is not "Green", list out each fault the system currently has, and append to error list.
+    for system in systems:
+        if system['Status'] != "Green":
+            for fault in system["Faults"]:
+                # Block out Dante Mute and NTP errors. 
+                # In a sufficiently large network, these types of alerts are guaranteed and not a priority.
+                if "DAN1" in fault["Message"] or "NTP" in fault["Message"]:
+                    continue
+
+                # Send alerts for new errors, once the new state has been swapped in.
+                error_id = system["Description"] + " - " + fault["Message"]
+                if error_id not in SageVue_Error_List and error_id not in temp_error_list:
+                    new_alerts.append(("SageVue", system["Description"], fault["Message"]))
+                temp_error_list.add(error_id)
+
+    # Swap in the errors found this cycle. If the error no longer exists, it is dropped. This prevents duplicate errors from sending out alerts.
+    with STATE_LOCK:
+        SageVue_Error_List.clear()
+        SageVue_Error_List.update(temp_error_list)
+
+    for alert in new_alerts:
+        add_to_alert_notif_push(*alert)
+
+    # Set the prometheus metrics with the new information.
+    Sagevue_Total_Errors.set(len(SageVue_Error_List))
+    Sagevue_Missing_Devices.set(len(api_devices.json()['Errors']))
 
 
 def get_sage_vue_status_message():
-    #Build out the error string with all currently active alerts.
-    if len(SageVue_Error_List) == 0:
-        return "No errors to report."
-    
-    temp_string = ""
-    temp_index = len(SageVue_Error_List)
-    for x in range(temp_index):
-        #Append each error to the new string.
-        temp_string = temp_string + SageVue_Error_List[x]
-        if x != temp_index - 1:
-            #If more errors exist, add a carriage return.
-            temp_string = temp_string + "\r"
-            
-    return temp_string
+    #Build out the error string with all currently active alerts, one per line.
+    with STATE_LOCK:
+        return "\r".join(sorted(SageVue_Error_List)) or "No errors to report."
 
 # endregion
 
 #region Fusion Functions
+#Returns the shared Fusion database connection, opening a new one if there is none or the current one is no longer usable.
+def get_fusion_connection():
+    global Fusion_Connection
+    if Fusion_Connection is not None:
+        try:
+            cursor = Fusion_Connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+            cursor.close()
+        except Exception:
+            close_fusion_connection()
+
+    if Fusion_Connection is None:
+        #Set up the Fusion database connection using the fusion credentials.
+        #The connection is only used for reads and stays open for a long time, so autocommit is enabled to avoid holding a transaction open.
+        Fusion_Connection = pymssql.connect(FusionSQLServer, FusionSQLUsername, FusionSQLPassword, "CrestronFusion", autocommit=True)
+    return Fusion_Connection
+
+#Yields each row of a cursor's result set, pulling the rows from the server in batches.
+def fetch_rows(cursor):
+    while True:
+        rows = cursor.fetchmany(Fusion_Fetch_Size)
+        if not rows:
+            break
+        yield from rows
+
+#Closes the shared Fusion database connection, so the next cycle reconnects.
+def close_fusion_connection():
+    global Fusion_Connection
+    try:
+        if Fusion_Connection is not None:
+            Fusion_Connection.close()
+    except Exception:
+        pass
+    Fusion_Connection = None
+
 def fusion_thread():
     
-    #Set up the Fusion database connection using the fusion credentials.
-    conn = pymssql.connect(FusionSQLServer, FusionSQLUsername, FusionSQLPassword, "CrestronFusion")
-    cursor = conn.cursor(as_dict=True)
-
-    #Get all Fusion Rooms that are offline.
-    cursor.execute('SELECT RoomName FROM CRV_Rooms '
-                   'WHERE RoomID IN (SELECT RoomID FROM CRV_RoomAttributeValues '
-                   'WHERE AttributeID = %s AND RawAnalogValue != 2)', 'ONLINE_STATUS')
-     
-    #Temporary list to hold offline rooms.
-    temp_offline = []
+    #Use the shared Fusion database connection.
+    #pymssql cursors on the same connection share a single result stream, so each query's results must be fully read before the next query is executed.
+    conn = get_fusion_connection()
+
+    try:
+        #Temporary list to hold offline rooms.
+        #Alerts for new issues in each section below are only queued once that section's state has been swapped in, so a query that fails partway through does not queue them again next cycle.
+        temp_offline = set()
+        new_alerts = []
+
+        #Get all Fusion Rooms that are offline, excluding blacklisted rooms.
+        with conn.cursor(as_dict=True) as cursor:
+            cursor.execute('SELECT r.RoomName FROM CRV_Rooms r '
+                           'WHERE r.RoomID IN (SELECT RoomID FROM CRV_RoomAttributeValues '
+                           'WHERE AttributeID = %s AND RawAnalogValue != 2) '
+                           'AND ' + Fusion_Blacklist_Predicate,
+                           ('ONLINE_STATUS',) + Fusion_Blacklist_Params)
     
-    for room in cursor:
-        #For each offline room:
-            #Check if this room is not in the global offline list.
-            #If not, check if the room name is blacklisted.
-            #If not blacklisted, add this room to the offline list.
-            #Also add to the list of alerts to send out.
-        temp_offline.append(room['RoomName'])
-        if room['RoomName'] not in Fusion_Offline_List:
-            if not any(ext in room['RoomName'] for ext in BLACKLISTED_KEYWORDS):
-                Fusion_Offline_List.append(room['RoomName'])
-                add_to_alert_notif_push("Fusion", room['RoomName'], "Room has gone offline")
+            for room in fetch_rows(cursor):
+                #For each offline room:
+                    #Add this room to the offline list.
+                    #If this room is not in the global offline list, also add to the list of alerts to send out.
+                if room['RoomName'] not in Fusion_Offline_List and room['RoomName'] not in temp_offline:
+                    new_alerts.append(("Fusion", room['RoomName'], "Room has gone offline"))
+                temp_offline.add(room['RoomName'])
                 
-    #If room has not been previously detected as offline, and was not in the query response, remove from the room offline list.
-    for room in Fusion_Offline_List:
-        if room not in temp_offline:
-            Fusion_Offline_List.remove(room)
-
-    #Get all Fusion Rooms that currently have error alerts.
-    cursor.execute('SELECT CRV_Rooms.RoomName, CRV_Rooms.RoomID FROM CRV_RoomAttributeValues '
-                   'FULL OUTER JOIN CRV_Rooms ON CRV_RoomAttributeValues.RoomID = CRV_Rooms.RoomID '
-                   'WHERE CRV_RoomAttributeValues.AttributeID = %s AND CRV_RoomAttributeValues.RawAnalogValue != 0','ERROR_ALERT')
-
-    #Reset the temporary list.
-    temp_error = []
-    
-    #For each room, gather the room name and room ID and place them in the list.
-    for room in cursor:
-        temp_error.append([room['RoomName'], room['RoomID']])
-    
-    #Using the ID from the query response, execute a new query to get the specific error message from the room.
-    for room in temp_error:
-        cursor.execute('SELECT RawSerialValue FROM CRV_RoomAttributeValues '
-                       'WHERE AttributeID = %s AND RoomID = %s',
-                       ('ERROR_MESSAGE', room[1]))
-        
-        #Append the error message to the room data list.
-        for x in cursor:
-            room.append(x['RawSerialValue'])
-
-    #For each room with errors:
-        #Check if this room is not in the global fusion error list.
-        #If not, check if the error message contains the indicator of an "ok" or a "notice".
-        #If not, add this room to the room error list.
-        #Also add to the list of alerts to send out.       
-    for room in temp_error:
-        if room not in Fusion_Error_List:
-            if "1:notice" not in room[2] and "0:ok" not in room[2]:
-                Fusion_Error_List.append(room)
-                add_to_alert_notif_push("Fusion", room[0], room[2])
-
-    #If room has not been previously detected as having errors, and was not in the query response, remove from the room error list.
-    for room in Fusion_Error_List:
-        if room not in temp_error:
-            Fusion_Error_List.remove(room)
-
-    #Get all Fusion Rooms that currently have help requests.
-    cursor.execute(
-        'SELECT CRV_Rooms.RoomName, CRV_Rooms.RoomID FROM CRV_RoomAttributeValues '
-        'FULL OUTER JOIN CRV_Rooms ON CRV_RoomAttributeValues.RoomID = CRV_Rooms.RoomID '
-        'WHERE CRV_RoomAttributeValues.AttributeID = %s AND CRV_RoomAttributeValues.RawDigitalValue != 0', 'HELP_ALERT')
-
-    #Reset the temporary list.
-    temp_error = []
-
-    #For each room, gather the room name and room ID and place them in the list.
-    for room in cursor:
-        temp_error.append([room['RoomName'], room['RoomID']])
-
-    #Using the ID from the query response, execute a new query to get the specific help request message from the room.
-    for room in temp_error:
-        cursor.execute('SELECT RawSerialValue FROM CRV_RoomAttributeValues '
-                       'WHERE AttributeID = %s AND RoomID = %s',
-                       ('HELP_MESSAGE', room[1]))
-
-        #Append the error message to the room data list.
-        for x in cursor:
-            room.append(x['RawSerialValue'])
-
-    #For each room with errors:
-        #Check if this room is not in the global fusion help request list.
-        #If not, add this room to the room error list.
-        #Also add to the list of help request alerts to send out.  
-    for room in temp_error:
-        if room not in Fusion_Help_Request_List:
-            Fusion_Help_Request_List.append(room)
-            send_help_request(room[0], room[2])
-    for room in Fusion_Help_Request_List:
-        if room not in temp_error:
-            Fusion_Help_Request_List.remove(room)
-
+        #Swap in the offline rooms found this cycle. Rooms that were not in the query response are dropped from the room offline list.
+        with STATE_LOCK:
+            Fusion_Offline_List.clear()
+            Fusion_Offline_List.update(temp_offline)
+
+        for alert in new_alerts:
+            add_to_alert_notif_push(*alert)
+
+        #Temporary list to hold rooms with errors, keyed by room ID and error message.
+        active_errors = {}
+        new_alerts = []
+
+        #Get all Fusion Rooms that currently have error alerts, along with the specific error message from each room, excluding blacklisted rooms.
+        with conn.cursor(as_dict=True) as cursor:
+            cursor.execute('SELECT r.RoomName, r.RoomID, msg.RawSerialValue FROM CRV_Rooms r '
+                           'JOIN CRV_RoomAttributeValues alert ON alert.RoomID = r.RoomID '
+                           'AND alert.AttributeID = %s AND alert.RawAnalogValue != 0 '
+                           'LEFT JOIN CRV_RoomAttributeValues msg ON msg.RoomID = r.RoomID AND msg.AttributeID = %s '
+                           'WHERE ' + Fusion_Blacklist_Predicate,
+                           ('ERROR_ALERT', 'ERROR_MESSAGE') + Fusion_Blacklist_Params)
+
+            for room in fetch_rows(cursor):
+                #For each room with errors:
+                    #Check if the error message contains the indicator of an "ok" or a "notice".
+                    #If not, add this room to the room error list.
+                    #If this room is not in the global fusion error list, also add to the list of alerts to send out.       
+                message = room['RawSerialValue'] or ""
+                if "1:notice" in message or "0:ok" in message:
+                    continue
+                error_key = (room['RoomID'], message)
+                if error_key not in Fusion_Error_List and error_key not in active_errors:
+                    new_alerts.append(("Fusion", room['RoomName'], message))
+                active_errors[error_key] = room['RoomName']
+
+        #Swap in the room errors found this cycle. Rooms that were not in the query response are dropped from the room error list.
+        with STATE_LOCK:
+            Fusion_Error_List.clear()
+            Fusion_Error_List.update(active_errors)
+
+        for alert in new_alerts:
+            add_to_alert_notif_push(*alert)
+
+        #Temporary list to hold rooms with help requests, keyed by room ID and help request message.
+        active_requests = {}
+        new_requests = []
+
+        #Get all Fusion Rooms that currently have help requests, along with the specific help request message from each room.
+        with conn.cursor(as_dict=True) as cursor:
+            cursor.execute('SELECT r.RoomName, r.RoomID, msg.RawSerialValue FROM CRV_Rooms r '
+                           'JOIN CRV_RoomAttributeValues alert ON alert.RoomID = r.RoomID '
+                           'AND alert.AttributeID = %s AND alert.RawDigitalValue != 0 '
+                           'LEFT JOIN CRV_RoomAttributeValues msg ON msg.RoomID = r.RoomID AND msg.AttributeID = %s',
+                           ('HELP_ALERT', 'HELP_MESSAGE'))
+
+            for room in fetch_rows(cursor):
+                #For each room with help requests:
+                    #Add this room to the room help request list.
+                    #If this room is not in the global fusion help request list, also add to the list of help request alerts to send out.  
+                message = room['RawSerialValue'] or ""
+                request_key = (room['RoomID'], message)
+                if request_key not in Fusion_Help_Request_List and request_key not in active_requests:
+                    new_requests.append((room['RoomName'], message))
+                active_requests[request_key] = room['RoomName']
+
+        #Swap in the help requests found this cycle.
+        with STATE_LOCK:
+            Fusion_Help_Request_List.clear()
+            Fusion_Help_Request_List.update(active_requests)
+
+        for room_name, message in new_requests:
+            send_help_request(room_name, message)
+    except Exception:
+        #Drop the connection on any failure, so the next cycle starts with a fresh one.
+        close_fusion_connection()
+        raise
 
 def get_fusion_status_message():
+    with STATE_LOCK:
+        #Nothing to report from fusion.
+        if len(Fusion_Error_List) == 0 and len(Fusion_Offline_List) == 0:
+            return "No errors to report."
     
-    #Nothing to report from fusion.
-    if len(Fusion_Error_List) == 0 and len(Fusion_Offline_List) == 0:
-        return "No errors to report."
+        #Gather all offline rooms and rooms with errors, and place in a list.
+        temp_error = []
+        for (room_id, message), room_name in Fusion_Error_List.items():
+            temp_error.append(room_name + " - " + message)
+        temp_error.sort()
+        for room in sorted(Fusion_Offline_List):
+            temp_error.append(room + " - " "Room is currently offline")
     
-    #Gather all offline rooms and rooms with errors, and place in a list.
-    temp_error = []
-    for room in Fusion_Error_List:
-        temp_error.append(room[0] + " - " + room[2])
-    for room in Fusion_Offline_List:
-        temp_error.append(room + " - " "Room is currently offline")
-    temp_index = len(temp_error)
-    temp_string = ""
-    
-    #Append each item in the list to a string, then return the string.
-    for x in range(temp_index):
-        temp_string = temp_string + temp_error[x]
-        if x != temp_index - 1:
-            #If more errors exist, add a carriage return.
-            temp_string = temp_string + "\r"
-    return temp_string
+    #Join the list into a single string, one item per line.
+    return "\r".join(temp_error)
 
 #endregion
 
 #region Zoom POST Functions
+#Posts a message to a Zoom webhook. The payload is serialized with orjson rather than by requests.
+#Error responses (such as 429 when rate limited) raise, so queued alerts and help requests are kept and retried.
+def post_webhook(channel, token, payload):
+    response = HTTP.post(channel,
+                         headers={'Authorization': token},
+                         timeout=HTTP_TIMEOUT,
+                         data=orjson.dumps(payload))
+    response.raise_for_status()
+
 def send_notification(message):
-    requests.post(usingNotifChannel,
-                  headers={'Authorization': usingNotifToken, "Content-Type": "application/json"},
-                  json={
-                      "head": {
-                          "text": "Program Notification",
-                          "style": {
-                              "color": "#9d0bf4"
-                          }
-                      },
-                      "body": [
-                          {
-                              "type": "message",
-                              "text": message,
-                              "style": {
-                                  "color": "#305acf"
-                              }
-                          }
-                      ]
-                  })
+    post_webhook(usingNotifChannel, usingNotifToken, {
+        "head": NOTIFICATION_HEAD,
+        "body": [
+            {
+                "type": "message",
+                "text": message,
+                "style": NOTIFICATION_STYLE
+            }
+        ]
+    })
     
+#Queues a help request, to be sent out with the next batch of help requests.
 def send_help_request(room, message):
     if SEND_ALERTS:
-        requests.post(usingHelpRequestChannel,
-                      headers={'Authorization': usingHelpRequestToken, "Content-Type": "application/json"},
-                      json={
-                          "head": {
-                              "text": "Help Request Alert",
-                              "style": {
-                                  "color": "#00FF00"
-                              }
-                          },
-                          "body": [
-                              {
-                                  "type": "message",
-                                  "text": "Room - " + room
-                              },
-                              {
-                                  "type": "message",
-                                  "text": "Customer says: " + message,
-                                  "style": {
-                                      "color": "#449FD4",
-                                      "sidebar_color": "#449FD4"
-                                  }
-                              }
-                          ]
-                      }
-        )
-        
+        HELP_REQUEST_QUEUE.append((room, message))
+
 def send_alert_notif():
-    if SEND_ALERTS and len(ALERTS_NOTIF_LIST) > 0:
-        temp_string = ""
-        temp_index = len(ALERTS_NOTIF_LIST)
-        for x in range(temp_index):
-            temp_string = temp_string + ALERTS_NOTIF_LIST[x]
-            if x != temp_index - 1:
-                temp_string = temp_string + "\r"
-        requests.post(usingAlertChannel,
-                      headers={'Authorization': usingAlertChannelToken, "Content-Type": "application/json"},
-                      json={
-                          "head": {
-                              "text": "Device Alert",
-                              "style": {
-                                  "color": "#C107EB"
-                              }
-                          },
-                          "body": [
-                              {
-                                  "type": "message",
-                                  "text": (str(len(ALERTS_NOTIF_LIST)) + " new device alert") + ("s." if len(ALERTS_NOTIF_LIST) > 1 else ".")
-                              },
-                              {
-                                  "type": "message",
-                                  "text": temp_string,
-                                  "style": {
-                                      "color": "#C107EB",
-                                      "sidebar_color": "#C107EB"
-                                  }
-                              }
-                          ]
-                      })
-    ALERTS_NOTIF_LIST.clear()
+    #Drain the alert queue. Alerts are drained even while alerting is disabled, so they do not pile up.
+    alerts = []
+    while True:
+        try:
+            alerts.append(ALERTS_NOTIF_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+
+    if SEND_ALERTS and len(alerts) > 0:
+        try:
+            post_webhook(usingAlertChannel, usingAlertChannelToken, {
+                "head": ALERT_HEAD,
+                "body": [
+                    {
+                        "type": "message",
+                        "text": (str(len(alerts)) + " new device alert") + ("s." if len(alerts) > 1 else ".")
+                    },
+                    {
+                        "type": "message",
+                        "text": "\r".join(alerts),
+                        "style": ALERT_STYLE
+                    }
+                ]
+            })
+        except Exception:
+            #Put the alerts back in the queue, so they are sent with the next batch.
+            for alert in alerts:
+                ALERTS_NOTIF_QUEUE.put(alert)
+            raise
+
+#Sends all queued help requests as a single webhook, once the frame interval has elapsed or the batch is full.
+def flush_help_requests():
+    global HELP_REQUEST_LAST_FLUSH
+    elapsed = timeit.default_timer() - HELP_REQUEST_LAST_FLUSH
+    if len(HELP_REQUEST_QUEUE) == 0 or (elapsed < WH_FRAME_INTERVAL and len(HELP_REQUEST_QUEUE) < WH_BATCH_MAX):
+        return
+
+    #Each help request uses two body blocks, so chunk the requests to stay under Zoom's body block limit.
+    #Help requests are only removed from the queue once their chunk has been posted, so a failed post is retried on the next cycle.
+    per_message = ZOOM_MAX_BODY_BLOCKS // 2
+    while HELP_REQUEST_QUEUE:
+        help_requests = list(itertools.islice(HELP_REQUEST_QUEUE, per_message))
+        body = []
+        for room, message in help_requests:
+            body.append({
+                "type": "message",
+                "text": "Room - " + room
+            })
+            body.append({
+                "type": "message",
+                "text": "Customer says: " + message,
+                "style": HELP_REQUEST_STYLE
+            })
+        post_webhook(usingHelpRequestChannel, usingHelpRequestToken, {
+            "head": HELP_REQUEST_HEAD,
+            "body": body
+        })
+        for _ in help_requests:
+            HELP_REQUEST_QUEUE.popleft()
+    HELP_REQUEST_LAST_FLUSH = timeit.default_timer()
 
 def craft_report_section(service, content):
+    style = REPORT_OK_STYLE if content in REPORT_OK_MESSAGES else REPORT_ERROR_STYLE
     return {
         "type": "section",
-        "sidebar_color": "#00FF00" if content == "No errors to report." or content == "No mics with low batteries." else "#C107EB",
+        "sidebar_color": style["color"],
         "sections": [
             {
                 "type": "message",
                 "text": "--- " + service + " --- ",
-                "style": {
-                    "color": "#0000FF"
-                }
+                "style": REPORT_TITLE_STYLE
             },
             {
                 "type": "message",
                 "text": content,
-                "style": {
-                    "color": "#00FF00" if content == "No errors to report." or content == "No mics with low batteries." else "#C107EB"
-                }
+                "style": style
             }
 
         ]
@@ -665,42 +971,43 @@ def run_report():
     sagevue = get_sage_vue_status_message()
     ddm = get_ddm_status_message()
     fusion = get_fusion_status_message()
-    requests.post(usingSODChannel,
-                  headers={'Authorization': usingSODToken, "Content-Type": "application/json"},
-                  json={
-                      "head": {
-                          "text": "SoD Report - " + str(datetime.date.today()),
-                          "style": {
-                              "color": "#00DD00"
-                          }
-                      },
-                      "body": [
-                          craft_report_section("SageVue", sagevue),
-                          craft_report_section("Dante Domain Manager", ddm),
-                          craft_report_section("Fusion", fusion)
-                      ]
-                  })
+    post_webhook(usingSODChannel, usingSODToken, {
+        "head": {
+            "text": "SoD Report - " + str(datetime.date.today()),
+            "style": REPORT_HEAD_STYLE
+        },
+        "body": [
+            craft_report_section("SageVue", sagevue),
+            craft_report_section("Dante Domain Manager", ddm),
+            craft_report_section("Fusion", fusion)
+        ]
+    })
 
 #endregion
 
 if __name__ == "__main__":
-    #Fetches the updated list of DDM domains.
-    schedule.every().day.at(script_variables['DDM_Domain_Fetch_Time']).do(get_dante_domains)
+    #Each scheduled event is run through run_source, as schedule does not reschedule an event that raises, and stops running the remaining pending events.
+
+    #Fetches the updated list of DDM domains. The fetch itself runs in the polling loop, so it is retried until it succeeds.
+    schedule.every().day.at(script_variables['DDM_Domain_Fetch_Time']).do(refresh_dante_domains)
     
     #Enables the alerts.
-    schedule.every().day.at(script_variables['Enable_Alerts_Time']).do(lambda: enable_alerts(False))
+    schedule.every().day.at(script_variables['Enable_Alerts_Time']).do(run_source, "Enable Alerts", lambda: enable_alerts(False))
     
     #Runs a report, detailing all the currently active alerts from each platform.
-    schedule.every().day.at(script_variables['Run_Report_Time']).do(run_report)
+    schedule.every().day.at(script_variables['Run_Report_Time']).do(run_source, "Report", run_report)
 
     #Disable the alerts.
-    schedule.every().day.at(script_variables['Disable_Alerts_Time']).do(lambda: disable_alerts(False))
-    
-    #Start the Prometheus server to enable metrics to be pulled.
-    start_http_server(8000)
+    schedule.every().day.at(script_variables['Disable_Alerts_Time']).do(run_source, "Disable Alerts", lambda: disable_alerts(False))
     
     #Start the script loop, which executes on a polling interval.
     start_services()
     
-    #Start the FLASK server, to allow for external control.
-    AlertREST.run(host="0.0.0.0", port=2030)
+    #Start the FLASK server, to allow for external control, with the Prometheus metrics served from /metrics.
+    #Both are served from a multithreaded WSGI server, so metric scrapes and REST requests do not block each other.
+    app = DispatcherMiddleware(AlertREST, {'/metrics': make_wsgi_app()})
+    try:
+        serve(app, host="0.0.0.0", port=2030, threads=HTTP_SERVER_THREADS)
+    finally:
+        #Once the server stops, stop polling and close the open connections.
+        stop_services()